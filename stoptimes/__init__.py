@@ -1,3 +1,26 @@
 from .stoptimes import (
     estimate_stop_times,
+)
+from .fitting import (
+    fit_polynomials,
+)
+from .backtest import (
+    backtest_polynomials,
+)
+from .speed_profile import (
+    SpeedProfile,
+    get_stop_distances,
+    learn_speed_profile,
+)
+from .streaming import (
+    ArrivalMatcher,
+    DelayStatistics,
+    ingest,
+    read_header,
+    read_socket,
+    replay_file,
+)
+from .frequencies import (
+    estimate_frequencies,
+    iter_frequency_stop_times,
 )
\ No newline at end of file
@@ -0,0 +1,174 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .fitting import GROUP_COLUMNS, evaluate, get_delays, power_sums, solve_coefficients
+
+
+# Arreglos compartidos por cada proceso del pool, se envían una sola vez
+_shared = {}
+
+
+def assign_folds(dates, method="kfold", n_folds=5, test_size=0.2):
+    """Assign each measurement to a fold according to its date.
+
+    All the measurements of a given date fall in the same fold, so a model is
+    never evaluated on a day it has seen during the fit.
+
+    Parameters
+    ----------
+    dates : array-like
+        The date of each measurement.
+    method : str
+        Either "kfold", which splits the dates in `n_folds` consecutive
+        blocks, or "holdout", which keeps the last `test_size` fraction of the
+        dates for evaluation.
+    n_folds : int
+        Number of folds for the "kfold" method.
+    test_size : float
+        Fraction of the dates held out by the "holdout" method.
+
+    Returns
+    -------
+    tuple
+        The fold of each measurement and the list of folds to evaluate.
+    """
+    unique_dates, date_codes = np.unique(np.asarray(dates), return_inverse=True)
+    n_dates = len(unique_dates)
+
+    if method == "kfold":
+        if not 2 <= n_folds <= n_dates:
+            raise ValueError("n_folds must be between 2 and the number of dates.")
+        date_folds = np.arange(n_dates) * n_folds // n_dates
+        test_folds = list(range(n_folds))
+    elif method == "holdout":
+        n_test = int(np.ceil(test_size * n_dates))
+        if not 0 < n_test < n_dates:
+            raise ValueError("test_size leaves no dates to fit or to evaluate.")
+        date_folds = (np.arange(n_dates) >= n_dates - n_test).astype(int)
+        test_folds = [1]
+    else:
+        raise ValueError("Invalid method. Use 'kfold' or 'holdout'.")
+
+    return date_folds[date_codes], test_folds
+
+
+def _init_worker(x, y, codes, n_groups, folds):
+    _shared.update(x=x, y=y, codes=codes, n_groups=n_groups, folds=folds)
+
+
+def _evaluate_fold(fold, degrees):
+    x, y, codes = _shared["x"], _shared["y"], _shared["codes"]
+    test = _shared["folds"] == fold
+    train = ~test
+
+    # Las sumas del grado mayor sirven para ajustar todos los grados menores
+    x_sums, xy_sums = power_sums(
+        x[train], y[train], codes[train], _shared["n_groups"], max(degrees)
+    )
+
+    predictions = {}
+    for degree in degrees:
+        coefficients = solve_coefficients(x_sums, xy_sums, degree)
+        predictions[degree] = evaluate(coefficients[codes[test]], x[test])
+
+    return np.flatnonzero(test), predictions
+
+
+def _error_table(errors, columns):
+    grouped = errors.groupby(columns + ["degree"], sort=True)["abs_error"]
+    table = pd.DataFrame(
+        {"mae": grouped.mean(), "p90": grouped.quantile(0.9), "n": grouped.count()}
+    )
+    return table.reset_index()
+
+
+def backtest_polynomials(
+    stops_measurement,
+    degrees=(4,),
+    method="kfold",
+    n_folds=5,
+    test_size=0.2,
+    max_workers=None,
+):
+    """Evaluate the delay polynomials against the measured stop times.
+
+    For every fold the polynomials of all the (route_id, service_id,
+    shape_id, stop_id) combinations are fitted on the remaining dates and used
+    to predict the delays of the held out dates. The folds are evaluated in
+    parallel in a process pool.
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    degrees : sequence of int
+        Polynomial degrees to compare.
+    method : str
+        Either "kfold" or "holdout", see `assign_folds`.
+    n_folds : int
+        Number of folds for the "kfold" method.
+    test_size : float
+        Fraction of the dates held out by the "holdout" method.
+    max_workers : int
+        Number of processes. With 1 the folds are evaluated in this process.
+
+    Returns
+    -------
+    tuple of DataFrame
+        The error table per stop and the error table per route, with the mean
+        absolute error (`mae`), the 90th percentile of the absolute error
+        (`p90`), both in seconds, and the number of predictions (`n`) for each
+        degree. The stops with ``timepoint == 1`` are the reference of the
+        delays and are not evaluated.
+    """
+    degrees = sorted(set(degrees))
+    measurement = get_delays(stops_measurement).reset_index(drop=True)
+    folds, test_folds = assign_folds(
+        measurement["date"], method=method, n_folds=n_folds, test_size=test_size
+    )
+    codes, groups = pd.MultiIndex.from_frame(
+        measurement[GROUP_COLUMNS]
+    ).factorize()
+    shared = (
+        measurement["departure_seconds"].to_numpy(),
+        measurement["delay"].to_numpy(),
+        codes,
+        len(groups),
+        folds,
+    )
+
+    if max_workers == 1:
+        _init_worker(*shared)
+        results = [_evaluate_fold(fold, degrees) for fold in test_folds]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=shared
+        ) as executor:
+            results = list(
+                executor.map(
+                    _evaluate_fold, test_folds, [degrees] * len(test_folds)
+                )
+            )
+
+    # Reunir las predicciones de todos los folds en una sola tabla, sin los
+    # timepoints, cuyo retraso es cero por definición
+    evaluated = measurement["timepoint"].to_numpy() != 1
+    errors = []
+    for rows, predictions in results:
+        keep = evaluated[rows]
+        rows = rows[keep]
+        for degree, predicted in predictions.items():
+            fold_errors = measurement.loc[rows, GROUP_COLUMNS].copy()
+            fold_errors["degree"] = degree
+            fold_errors["abs_error"] = np.abs(
+                predicted[keep] - measurement["delay"].to_numpy()[rows]
+            )
+            errors.append(fold_errors)
+    errors = pd.concat(errors, ignore_index=True).dropna(subset=["abs_error"])
+
+    stop_errors = _error_table(errors, GROUP_COLUMNS)
+    route_errors = _error_table(errors, ["route_id"])
+
+    return stop_errors, route_errors
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+
+GROUP_COLUMNS = ["route_id", "service_id", "shape_id", "stop_id"]
+
+# Las horas de salida se centran en el mediodía y se escalan a [-1, 1] para
+# que las sumas de potencias no pierdan precisión con polinomios de grado alto
+X_CENTER = 43200.0
+X_SCALE = 43200.0
+
+
+def time_to_seconds(times):
+    """Convert GTFS time strings to seconds after midnight.
+
+    Parameters
+    ----------
+    times : array-like
+        Times in HH:MM:SS or HH:MM format. Hours past 24 are accepted.
+
+    Returns
+    -------
+    ndarray
+        The times in seconds as floats. Missing or unparsable times are NaN.
+    """
+    times = pd.Series(np.asarray(times, dtype=object)).astype("string")
+    parts = times.str.split(":", expand=True).reindex(columns=range(3))
+    parts = parts.apply(pd.to_numeric, errors="coerce").astype(float)
+
+    # Sólo los minutos y segundos ausentes valen cero, no la hora
+    seconds = parts[0] * 3600 + parts[1].fillna(0.0) * 60 + parts[2].fillna(0.0)
+    return seconds.to_numpy()
+
+
+def seconds_to_time(seconds):
+    """Format seconds after midnight as GTFS HH:MM:SS strings.
+
+    Hours past 24 are kept, as GTFS requires for trips that end after
+    midnight. Missing values are returned as None.
+    """
+    seconds = pd.Series(np.asarray(seconds, dtype=float)).round()
+    valid = seconds.notna()
+    total = seconds[valid].astype(np.int64)
+    times = pd.Series(None, index=seconds.index, dtype=object)
+    times[valid] = (
+        (total // 3600).astype(str).str.zfill(2)
+        + ":"
+        + (total // 60 % 60).astype(str).str.zfill(2)
+        + ":"
+        + (total % 60).astype(str).str.zfill(2)
+    )
+    return times.to_numpy()
+
+
+def get_delays(stops_measurement) -> pd.DataFrame:
+    """Compute the delay of every measurement with respect to its trip start.
+
+    This is the vectorized equivalent of applying `get_delay` to each
+    (trip_id, date) group: the reference time is the arrival at the first stop
+    with ``timepoint == 1``.
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+
+    Returns
+    -------
+    DataFrame
+        A copy of the measurements with the columns `departure_seconds` and
+        `delay`, both in seconds. Trips without a timepoint and measurements
+        without an arrival time are dropped.
+    """
+    measurement = stops_measurement.copy()
+    arrival_seconds = time_to_seconds(measurement["arrival_time"])
+
+    # Hora del primer 'timepoint' de cada combinación (trip_id, date)
+    reference = pd.Series(arrival_seconds, index=measurement.index).where(
+        measurement["timepoint"] == 1
+    )
+    reference = reference.groupby(
+        [measurement["trip_id"], measurement["date"]], sort=False
+    ).transform("first")
+
+    measurement["departure_seconds"] = reference
+    measurement["delay"] = arrival_seconds - reference
+
+    return measurement.dropna(subset=["delay"])
+
+
+def power_sums(x, y, codes, n_groups, degree):
+    """Accumulate the least squares statistics of each group.
+
+    The fit of a polynomial of degree ``d`` only depends on the sums of the
+    powers of x up to ``2d`` and of ``y`` times the powers of x up to ``d``, so
+    these sums can be computed once for all groups and updated incrementally.
+
+    Parameters
+    ----------
+    x : ndarray
+        Trip departure times in seconds.
+    y : ndarray
+        Delays in seconds.
+    codes : ndarray
+        Integer group index of each observation.
+    n_groups : int
+        Total number of groups.
+    degree : int
+        Highest polynomial degree that will be fitted with these sums.
+
+    Returns
+    -------
+    tuple of ndarray
+        The sums of powers of x, shape ``(n_groups, 2 * degree + 1)``, and the
+        sums of y times powers of x, shape ``(n_groups, degree + 1)``.
+    """
+    u = (np.asarray(x, dtype=float) - X_CENTER) / X_SCALE
+    y = np.asarray(y, dtype=float)
+    x_sums = np.empty((n_groups, 2 * degree + 1))
+    xy_sums = np.empty((n_groups, degree + 1))
+
+    power = np.ones_like(u)
+    for k in range(2 * degree + 1):
+        x_sums[:, k] = np.bincount(codes, weights=power, minlength=n_groups)
+        if k <= degree:
+            xy_sums[:, k] = np.bincount(codes, weights=power * y, minlength=n_groups)
+        power = power * u
+
+    return x_sums, xy_sums
+
+
+def solve_coefficients(x_sums, xy_sums, degree):
+    """Solve the normal equations of every group at once.
+
+    Groups with fewer distinct departure times than coefficients get the
+    minimum norm solution, as `np.polyfit` does.
+
+    Returns
+    -------
+    ndarray
+        Coefficients in increasing powers of the scaled departure time, shape
+        ``(n_groups, degree + 1)``. Rows of groups without data are NaN.
+    """
+    idx = np.arange(degree + 1)
+    gram = x_sums[:, idx[:, None] + idx[None, :]]
+    coefficients = np.linalg.pinv(gram, hermitian=True) @ xy_sums[:, : degree + 1, None]
+    coefficients = coefficients[..., 0]
+    coefficients[x_sums[:, 0] == 0] = np.nan
+    return coefficients
+
+
+def evaluate(coefficients, x):
+    """Evaluate scaled polynomials with Horner's rule.
+
+    Parameters
+    ----------
+    coefficients : ndarray
+        Coefficients as returned by `solve_coefficients`, with shape
+        ``(..., degree + 1)``.
+    x : ndarray
+        Departure times in seconds, broadcastable against
+        ``coefficients[..., 0]``.
+
+    Returns
+    -------
+    ndarray
+        The estimated delays in seconds.
+    """
+    u = (np.asarray(x, dtype=float) - X_CENTER) / X_SCALE
+    result = np.zeros(np.broadcast_shapes(u.shape, coefficients.shape[:-1]))
+    for k in range(coefficients.shape[-1] - 1, -1, -1):
+        result = result * u + coefficients[..., k]
+    return result
+
+
+def to_poly1d(coefficients):
+    """Convert scaled coefficients to a `np.poly1d` of the time in seconds."""
+    scaled = np.poly1d(coefficients[::-1])
+    u = np.poly1d([1 / X_SCALE, -X_CENTER / X_SCALE])
+    return np.polyval(scaled, u)
+
+
+def fit_polynomials(stops_measurement, degree=4):
+    """Fit the delay polynomials of every stop without per-group loops.
+
+    Produces the same kind of dictionary as `get_polynomials`, keyed by
+    (route_id, service_id, shape_id, stop_id).
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    degree : int
+        Degree of the polynomials.
+
+    Returns
+    -------
+    dict
+        A dictionary with a `np.poly1d` for each combination.
+    """
+    measurement = get_delays(stops_measurement)
+    codes, groups = pd.MultiIndex.from_frame(
+        measurement[GROUP_COLUMNS]
+    ).factorize()
+    x_sums, xy_sums = power_sums(
+        measurement["departure_seconds"],
+        measurement["delay"],
+        codes,
+        len(groups),
+        degree,
+    )
+    coefficients = solve_coefficients(x_sums, xy_sums, degree)
+
+    return {
+        group: to_poly1d(coefficients[i]) for i, group in enumerate(groups)
+    }
@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+
+from .fitting import seconds_to_time, time_to_seconds
+from .gtfs import build_stop_times
+from .speed_profile import PATTERN_COLUMNS, get_stop_sequences
+
+
+def iter_frequency_starts(frequencies):
+    """Expand each frequency definition into the start times of its trips.
+
+    The start times are generated one definition at a time, so only those of
+    a single headway window are in memory.
+
+    Parameters
+    ----------
+    frequencies : DataFrame
+        The GTFS frequencies, with `trip_id`, `start_time`, `end_time` and
+        `headway_secs`.
+
+    Yields
+    ------
+    tuple
+        The trip_id of the definition, its start and end times in seconds and
+        the array with the start time of each trip. Trips start every
+        `headway_secs` from `start_time` and before `end_time`.
+    """
+    starts = time_to_seconds(frequencies["start_time"])
+    ends = time_to_seconds(frequencies["end_time"])
+    headways = frequencies["headway_secs"].to_numpy(dtype=float)
+
+    for trip_id, start, end, headway in zip(
+        frequencies["trip_id"], starts, ends, headways
+    ):
+        yield trip_id, start, end, np.arange(start, end, headway)
+
+
+def get_pattern_coefficients(polynomials, pattern, sequence_of_stops):
+    """Stack the polynomials of the stops of a pattern in a single array.
+
+    Parameters
+    ----------
+    polynomials : dict
+        The polynomials of each (route_id, service_id, shape_id, stop_id), as
+        returned by `get_polynomials`.
+    pattern : tuple
+        The (route_id, service_id, shape_id) of the trips.
+    sequence_of_stops : array-like
+        The stops of the pattern.
+
+    Returns
+    -------
+    ndarray
+        The coefficients in decreasing powers, shape ``(n_stops, degree + 1)``.
+        Stops without a polynomial are NaN.
+    """
+    stop_polynomials = [
+        polynomials.get(tuple(pattern) + (stop_id,)) for stop_id in sequence_of_stops
+    ]
+    degree = max(
+        (polynomial.order for polynomial in stop_polynomials if polynomial is not None),
+        default=0,
+    )
+    coefficients = np.full((len(sequence_of_stops), degree + 1), np.nan)
+    for i, polynomial in enumerate(stop_polynomials):
+        if polynomial is not None:
+            coefficients[i] = 0
+            coefficients[i, degree - polynomial.order :] = polynomial.coeffs
+    return coefficients
+
+
+def evaluate_delays(coefficients, start_times):
+    """Evaluate the polynomials of all the stops for all the trips at once.
+
+    Returns
+    -------
+    ndarray
+        The delay of each stop in seconds, shape ``(n_trips, n_stops)``.
+    """
+    start_times = np.asarray(start_times, dtype=float)[:, None]
+    delays = np.zeros((len(start_times), len(coefficients)))
+    for k in range(coefficients.shape[1]):
+        delays = delays * start_times + coefficients[:, k]
+    return delays
+
+
+def _build_trips(parents, trip_id, new_trip_ids, columns):
+    # Copiar la fila de trips.txt del viaje original para cada viaje nuevo
+    new_trips = parents.loc[[trip_id]].iloc[np.zeros(len(new_trip_ids), dtype=int)]
+    new_trips = new_trips.reset_index()
+    new_trips["trip_id"] = new_trip_ids
+    return new_trips[columns]
+
+
+def iter_frequency_stop_times(frequencies, polynomials, route_stops, trips):
+    """Estimate the stop times of every trip generated by the frequencies.
+
+    All the trips of a headway window are evaluated at once against the
+    polynomials of their pattern, and the result is yielded per window.
+    Each generated trip is named after the trip_id of its definition and its
+    start time, for example ``L1_desde_centro_06:10:00``.
+
+    Parameters
+    ----------
+    frequencies : DataFrame
+        The GTFS frequencies.
+    polynomials : dict
+        The polynomials of each (route_id, service_id, shape_id, stop_id).
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trips : DataFrame
+        The GTFS trips, with the pattern of each trip_id of `frequencies`.
+
+    Yields
+    ------
+    tuple of DataFrame
+        The trips of each frequency definition, copied from the row of its
+        trip_id in `trips`, and their stop times.
+    """
+    parents = trips.drop_duplicates("trip_id").set_index("trip_id")
+    sequences = get_stop_sequences(route_stops)
+    models = {}
+
+    for trip_id, start, end, start_times in iter_frequency_starts(frequencies):
+        pattern = tuple(parents.loc[trip_id, PATTERN_COLUMNS])
+        if pattern not in models:
+            sequence = sequences.get((pattern[0], pattern[2]))
+            sequence_of_stops = (
+                sequence["stop_id"].to_numpy() if sequence is not None else np.array([])
+            )
+            models[pattern] = (
+                sequence_of_stops,
+                get_pattern_coefficients(polynomials, pattern, sequence_of_stops),
+            )
+        sequence_of_stops, coefficients = models[pattern]
+        if len(sequence_of_stops) == 0 or len(start_times) == 0:
+            continue
+
+        arrivals = start_times[:, None] + evaluate_delays(coefficients, start_times)
+        trip_ids = np.char.add(f"{trip_id}_", seconds_to_time(start_times).astype(str))
+        yield (
+            _build_trips(parents, trip_id, trip_ids, trips.columns),
+            build_stop_times(trip_ids, sequence_of_stops, arrivals),
+        )
+
+
+def get_frequency_templates(
+    frequencies, polynomials, route_stops, trips, max_window=3600
+):
+    """Estimate template trips for the frequency definitions.
+
+    Instead of listing every trip, each headway window is split into
+    sub-windows of at most `max_window` seconds, aligned with the start times
+    of its trips. Each sub-window gets its own GTFS frequencies row and a
+    single template trip. The template's stop times are evaluated at the
+    middle of the sub-window and start at its beginning, so every trip of the
+    sub-window is the template shifted by its own start time. The delays
+    therefore follow the time of day in steps of `max_window`, and the size
+    of the result does not depend on the headway.
+
+    Parameters
+    ----------
+    frequencies : DataFrame
+        The GTFS frequencies.
+    polynomials : dict
+        The polynomials of each (route_id, service_id, shape_id, stop_id).
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trips : DataFrame
+        The GTFS trips, with the pattern of each trip_id of `frequencies`.
+    max_window : float
+        Longest sub-window in seconds, or None to use a single template for
+        the whole window. Headways longer than `max_window` give one trip per
+        sub-window.
+
+    Returns
+    -------
+    tuple of DataFrame
+        The stop times of the template trips, the template trips, copied from
+        the row of the original trip_id in `trips` and named like the first
+        trip of their sub-window, and the frequencies of the sub-windows
+        pointing to them. Definitions whose pattern has no sequence of stops
+        are dropped.
+    """
+    frequencies = frequencies.reset_index(drop=True)
+    parents = trips.drop_duplicates("trip_id").set_index("trip_id")
+    sequences = get_stop_sequences(route_stops)
+    headways = frequencies["headway_secs"].to_numpy(dtype=float)
+    rows, window_starts, window_ends = [], [], []
+    template_trips = []
+    stop_times = []
+
+    for i, (trip_id, start, end, start_times) in enumerate(
+        iter_frequency_starts(frequencies)
+    ):
+        pattern = tuple(parents.loc[trip_id, PATTERN_COLUMNS])
+        sequence = sequences.get((pattern[0], pattern[2]))
+        if sequence is None or len(start_times) == 0:
+            continue
+        sequence_of_stops = sequence["stop_id"].to_numpy()
+        coefficients = get_pattern_coefficients(polynomials, pattern, sequence_of_stops)
+
+        # Subventanas con un número entero de intervalos entre viajes
+        if max_window is None:
+            step = end - start
+        else:
+            step = max(np.floor(max_window / headways[i]), 1) * headways[i]
+        starts = np.arange(start, end, step)
+        ends = np.minimum(starts + step, end)
+        template_ids = np.char.add(f"{trip_id}_", seconds_to_time(starts).astype(str))
+
+        # Los retrasos del centro de cada subventana representan a sus viajes
+        delays = evaluate_delays(coefficients, (starts + ends) / 2)
+        template_trips.append(
+            _build_trips(parents, trip_id, template_ids, trips.columns)
+        )
+        stop_times.append(
+            build_stop_times(template_ids, sequence_of_stops, starts[:, None] + delays)
+        )
+        rows.extend([i] * len(starts))
+        window_starts.append(starts)
+        window_ends.append(ends)
+
+    if not stop_times:
+        return (
+            build_stop_times([], [], np.empty((0, 0))),
+            trips.iloc[:0],
+            frequencies.iloc[:0],
+        )
+    template_trips = pd.concat(template_trips, ignore_index=True)
+    frequencies = frequencies.iloc[rows].reset_index(drop=True)
+    frequencies["trip_id"] = template_trips["trip_id"].to_numpy()
+    frequencies["start_time"] = seconds_to_time(np.concatenate(window_starts))
+    frequencies["end_time"] = seconds_to_time(np.concatenate(window_ends))
+    return pd.concat(stop_times, ignore_index=True), template_trips, frequencies
+
+
+def estimate_frequencies(
+    frequencies,
+    polynomials,
+    route_stops,
+    trips,
+    representation="exact",
+    max_window=3600,
+):
+    """Estimate the stop times of the trips defined by headways.
+
+    Parameters
+    ----------
+    frequencies : DataFrame
+        The GTFS frequencies.
+    polynomials : dict
+        The polynomials of each (route_id, service_id, shape_id, stop_id).
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trips : DataFrame
+        The GTFS trips, with the pattern of each trip_id of `frequencies`.
+    representation : str
+        Either "exact", to list the stop times of every generated trip (see
+        `iter_frequency_stop_times`), or "template", to keep the frequencies
+        with one template trip per sub-window of at most `max_window`
+        seconds (see `get_frequency_templates`). Templates only follow the
+        time of day from one sub-window to the next.
+    max_window : float
+        Longest sub-window of the "template" representation in seconds.
+
+    Returns
+    -------
+    tuple of DataFrame
+        The stop times and the trips they belong to, and with "template" also
+        the updated frequencies.
+    """
+    if representation == "exact":
+        new_trips, stop_times = [], []
+        for window_trips, window_stop_times in iter_frequency_stop_times(
+            frequencies, polynomials, route_stops, trips
+        ):
+            new_trips.append(window_trips)
+            stop_times.append(window_stop_times)
+        if not stop_times:
+            return build_stop_times([], [], np.empty((0, 0))), trips.iloc[:0]
+        return (
+            pd.concat(stop_times, ignore_index=True),
+            pd.concat(new_trips, ignore_index=True),
+        )
+    elif representation == "template":
+        return get_frequency_templates(
+            frequencies, polynomials, route_stops, trips, max_window=max_window
+        )
+    else:
+        raise ValueError("Invalid representation. Use 'exact' or 'template'.")
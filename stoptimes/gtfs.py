@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from .fitting import seconds_to_time
+
+
+STOP_TIMES_COLUMNS = [
+    "trip_id",
+    "arrival_time",
+    "departure_time",
+    "stop_id",
+    "stop_sequence",
+    "timepoint",
+    "shape_dist_traveled",
+    "stop_headsign",
+    "pickup_type",
+    "drop_off_type",
+    "continuous_pickup",
+    "continuous_drop_off",
+]
+
+
+def build_stop_times(trip_ids, sequence_of_stops, arrivals, shape_dist_traveled=0):
+    """Build the GTFS stop_times of several trips with the same stops.
+
+    The first stop of each trip is marked as its timepoint.
+
+    Parameters
+    ----------
+    trip_ids : array-like
+        The trip_id of each trip.
+    sequence_of_stops : array-like
+        The stops visited by all the trips, in order.
+    arrivals : ndarray
+        The arrival time at each stop in seconds, shape
+        ``(n_trips, n_stops)``.
+    shape_dist_traveled : float or array-like
+        The distance traveled at each stop, either a single value or one per
+        stop.
+
+    Returns
+    -------
+    DataFrame
+        The stop times with the columns `STOP_TIMES_COLUMNS`.
+    """
+    n_trips, n_stops = len(trip_ids), len(sequence_of_stops)
+    arrivals = np.asarray(arrivals, dtype=float).reshape(n_trips, n_stops)
+    times = seconds_to_time(arrivals.ravel())
+    positions = np.arange(n_stops)
+
+    return pd.DataFrame(
+        {
+            "trip_id": np.repeat(np.asarray(trip_ids), n_stops),
+            "arrival_time": times,
+            "departure_time": times,
+            "stop_id": np.tile(np.asarray(sequence_of_stops), n_trips),
+            "stop_sequence": np.tile(positions, n_trips),
+            "timepoint": np.tile((positions == 0).astype(int), n_trips),
+            "shape_dist_traveled": np.broadcast_to(
+                shape_dist_traveled, (n_trips, n_stops)
+            ).ravel(),
+            "stop_headsign": 0,
+            "pickup_type": 0,
+            "drop_off_type": 0,
+            "continuous_pickup": 0,
+            "continuous_drop_off": 0,
+        },
+        columns=STOP_TIMES_COLUMNS,
+    )
@@ -0,0 +1,312 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .fitting import time_to_seconds
+
+
+PATTERN_COLUMNS = ["route_id", "service_id", "shape_id"]
+
+avg_bus_speed = 20  # km/h, velocidad usada donde no hay mediciones
+
+
+@dataclass
+class SpeedProfile:
+    """Average bus speed of every segment of every pattern by time of day.
+
+    A pattern is a (route_id, service_id, shape_id) combination and segment
+    ``s`` joins stops ``s`` and ``s + 1`` of its sequence.
+
+    Attributes
+    ----------
+    patterns : MultiIndex
+        The (route_id, service_id, shape_id) of each pattern.
+    stops : list of ndarray
+        The sequence of stops of each pattern.
+    distances : ndarray
+        Length of each segment in km, shape ``(n_patterns, n_segments)``.
+        Patterns with fewer stops are padded with NaN.
+    speeds : ndarray
+        Speed in km/h, shape ``(n_patterns, n_segments, n_bins)``.
+    bin_edges : ndarray
+        Start of each time of day bin in seconds after midnight.
+    """
+
+    patterns: pd.MultiIndex
+    stops: list
+    distances: np.ndarray
+    speeds: np.ndarray
+    bin_edges: np.ndarray
+
+    def get_bins(self, seconds):
+        """Return the time of day bin of each time in seconds."""
+        seconds = np.asarray(seconds) % 86400
+        return np.searchsorted(self.bin_edges, seconds, side="right") - 1
+
+
+def get_stop_distances(shapes, stops, route_stops) -> pd.DataFrame:
+    """Locate the stops of each shape and measure their distance along it.
+
+    Each stop is matched to the closest point of the shape, as
+    `find_stops_in_shape` does in the reference implementation, but comparing
+    all the stops against all the points of the shape at once.
+
+    Parameters
+    ----------
+    shapes : DataFrame
+        The GTFS shapes, with `shape_dist_traveled` in km.
+    stops : DataFrame
+        The GTFS stops, with `stop_lat` and `stop_lon`.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+
+    Returns
+    -------
+    DataFrame
+        A copy of `route_stops` with the column `shape_dist_traveled`. It is
+        NaN for the stops without coordinates, so their segments are left out
+        of `learn_speed_profile`.
+    """
+    route_stops = route_stops.merge(
+        stops[["stop_id", "stop_lat", "stop_lon"]], on="stop_id", how="left"
+    )
+    shapes = shapes.sort_values(["shape_id", "shape_pt_sequence"])
+    distances = pd.Series(np.nan, index=route_stops.index)
+    coordinates = route_stops[["stop_lat", "stop_lon"]].to_numpy(dtype=float)
+    # Las paradas sin coordenadas quedan sin distancia
+    located = np.isfinite(coordinates).all(axis=1)
+
+    for shape_id, shape in shapes.groupby("shape_id", sort=False):
+        in_shape = (route_stops["shape_id"] == shape_id).to_numpy() & located
+        points = shape[["shape_pt_lat", "shape_pt_lon"]].to_numpy(dtype=float)
+        stop_points = coordinates[in_shape]
+        closest = np.argmin(
+            ((stop_points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2), axis=1
+        )
+        distances[in_shape] = shape["shape_dist_traveled"].to_numpy(dtype=float)[
+            closest
+        ]
+
+    route_stops["shape_dist_traveled"] = distances
+    return route_stops.drop(columns=["stop_lat", "stop_lon"])
+
+
+def get_stop_sequences(route_stops):
+    """Split the route stops into the sequence of each route and shape.
+
+    The stops keep the order of `stop_sequence` if the column exists, and
+    the order of `route_stops` otherwise. Repeated stops are kept only the
+    first time, as in `get_sequence_of_stops`.
+
+    Parameters
+    ----------
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+
+    Returns
+    -------
+    dict
+        The rows of `route_stops` of each (route_id, shape_id), in order.
+    """
+    if "stop_sequence" in route_stops:
+        route_stops = route_stops.sort_values("stop_sequence", kind="stable")
+    route_stops = route_stops.drop_duplicates(["route_id", "shape_id", "stop_id"])
+    return {
+        key: group for key, group in route_stops.groupby(["route_id", "shape_id"])
+    }
+
+
+def learn_speed_profile(
+    stops_measurement, route_stops, trips=None, bin_size=3600, default_speed=avg_bus_speed
+) -> SpeedProfile:
+    """Learn the speed of each segment by time of day from the measurements.
+
+    The speed of a segment in a bin is the total distance travelled divided by
+    the total time spent on it by the measured trips that left its first stop
+    during the bin. Bins without measurements take the average speed of the
+    segment, and segments without measurements take `default_speed`.
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape, with
+        the column `shape_dist_traveled` in km (see `get_stop_distances`).
+    trips : DataFrame
+        The GTFS trips. Its patterns are included even if they were never
+        measured, so that every trip of the feed can be estimated.
+    bin_size : int
+        Width of the time of day bins in seconds.
+    default_speed : float
+        Speed in km/h of the segments without measurements.
+
+    Returns
+    -------
+    SpeedProfile
+        The learned speed profile.
+    """
+    if "shape_dist_traveled" not in route_stops:
+        raise ValueError(
+            "route_stops needs the column 'shape_dist_traveled', see get_stop_distances."
+        )
+
+    keys = [stops_measurement[PATTERN_COLUMNS]]
+    if trips is not None:
+        keys.append(trips[PATTERN_COLUMNS])
+    patterns = pd.MultiIndex.from_frame(
+        pd.concat(keys).drop_duplicates().sort_values(PATTERN_COLUMNS)
+    )
+    sequences = get_stop_sequences(route_stops)
+
+    # Secuencias de paradas y distancias de los segmentos de cada patrón
+    stops = []
+    for route_id, service_id, shape_id in patterns:
+        sequence = sequences.get((route_id, shape_id))
+        stops.append(
+            sequence if sequence is not None else route_stops.iloc[:0]
+        )
+    n_segments = max(max((len(sequence) for sequence in stops), default=0) - 1, 0)
+    distances = np.full((len(patterns), n_segments), np.nan)
+    for p, sequence in enumerate(stops):
+        distances[p, : max(len(sequence) - 1, 0)] = np.abs(
+            np.diff(sequence["shape_dist_traveled"].to_numpy(dtype=float))
+        )
+    stops = [sequence["stop_id"].to_numpy() for sequence in stops]
+
+    bin_edges = np.arange(0, 86400, bin_size)
+    profile = SpeedProfile(
+        patterns=patterns,
+        stops=stops,
+        distances=distances,
+        speeds=np.full((len(patterns), n_segments, len(bin_edges)), np.nan),
+        bin_edges=bin_edges,
+    )
+
+    # Posición de cada medición en (patrón, parada)
+    positions = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "pattern": p,
+                    "stop_id": sequence,
+                    "position": np.arange(len(sequence)),
+                }
+            )
+            for p, sequence in enumerate(stops)
+        ]
+        or [
+            pd.DataFrame(
+                {
+                    "pattern": np.array([], dtype=np.intp),
+                    "stop_id": np.array([], dtype=object),
+                    "position": np.array([], dtype=np.intp),
+                }
+            )
+        ],
+        ignore_index=True,
+    )
+    measurement = pd.DataFrame(
+        {
+            "trip_id": stops_measurement["trip_id"].to_numpy(),
+            "date": stops_measurement["date"].to_numpy(),
+            "pattern": patterns.get_indexer(
+                pd.MultiIndex.from_frame(stops_measurement[PATTERN_COLUMNS])
+            ),
+            "stop_id": stops_measurement["stop_id"].to_numpy(),
+            "arrival": time_to_seconds(stops_measurement["arrival_time"]),
+        }
+    )
+    measurement = measurement.merge(positions, on=["pattern", "stop_id"])
+    measurement = measurement.sort_values(["trip_id", "date", "position"])
+
+    # Tiempo entre paradas consecutivas de un mismo viaje
+    previous = measurement.shift(1)
+    consecutive = (
+        (measurement["trip_id"] == previous["trip_id"])
+        & (measurement["date"] == previous["date"])
+        & (measurement["position"] == previous["position"] + 1)
+    ).to_numpy()
+    pattern = measurement["pattern"].to_numpy()[consecutive]
+    segment = measurement["position"].to_numpy()[consecutive] - 1
+    travel_time = (measurement["arrival"] - previous["arrival"]).to_numpy()[consecutive]
+    time_bin = profile.get_bins(previous["arrival"].to_numpy()[consecutive])
+    valid = (travel_time > 0) & np.isfinite(distances[pattern, segment])
+    pattern, segment, travel_time, time_bin = (
+        pattern[valid],
+        segment[valid],
+        travel_time[valid],
+        time_bin[valid],
+    )
+
+    # Velocidad por (patrón, segmento, franja) como distancia total / tiempo total
+    shape = profile.speeds.shape
+    index = np.ravel_multi_index((pattern, segment, time_bin), shape)
+    total_distance = np.bincount(
+        index, weights=distances[pattern, segment], minlength=np.prod(shape)
+    ).reshape(shape)
+    total_time = np.bincount(
+        index, weights=travel_time / 3600, minlength=np.prod(shape)
+    ).reshape(shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = total_distance / total_time
+        segment_speeds = total_distance.sum(axis=2) / total_time.sum(axis=2)
+    segment_speeds = np.where(
+        np.isfinite(segment_speeds) & (segment_speeds > 0), segment_speeds, default_speed
+    )
+    profile.speeds = np.where(
+        np.isfinite(speeds) & (speeds > 0), speeds, segment_speeds[:, :, None]
+    )
+
+    return profile
+
+
+def estimate_arrivals(profile, pattern, start_times, iterations=1):
+    """Estimate the arrival times of all the trips of a pattern at once.
+
+    The travel time of every segment of every trip is computed from the speed
+    of the bin in which the trip starts, and the arrival times are their
+    cumulative sum. Each additional iteration recomputes the travel times with
+    the bin in which the trip actually reaches each segment.
+
+    Parameters
+    ----------
+    profile : SpeedProfile
+        The speed profile.
+    pattern : tuple
+        The (route_id, service_id, shape_id) of the trips.
+    start_times : array-like
+        The start time of each trip in seconds after midnight.
+    iterations : int
+        Number of refinements of the time of day bin of each segment.
+
+    Returns
+    -------
+    ndarray
+        The arrival time at each stop in seconds, shape
+        ``(n_trips, n_stops)``.
+    """
+    p = profile.patterns.get_loc(tuple(pattern))
+    n_segments = len(profile.stops[p]) - 1
+    start_times = np.asarray(start_times, dtype=float)
+    if n_segments < 0:
+        return np.empty((len(start_times), 0))
+
+    distances = profile.distances[p, :n_segments]
+    speeds = profile.speeds[p, :n_segments]
+    segments = np.arange(n_segments)
+
+    time_bin = np.broadcast_to(
+        profile.get_bins(start_times)[:, None], (len(start_times), n_segments)
+    )
+    for _ in range(iterations + 1):
+        travel_times = 3600 * distances / speeds[segments, time_bin]
+        arrivals = np.concatenate(
+            [start_times[:, None], start_times[:, None] + np.cumsum(travel_times, axis=1)],
+            axis=1,
+        )
+        time_bin = profile.get_bins(arrivals[:, :-1])
+
+    return arrivals
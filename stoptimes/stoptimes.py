@@ -4,6 +4,16 @@ import matplotlib.pyplot as plt
 import shapely
 import geopandas as gpd
 
+from .fitting import fit_polynomials, time_to_seconds
+from .frequencies import estimate_frequencies, evaluate_delays, get_pattern_coefficients
+from .gtfs import STOP_TIMES_COLUMNS, build_stop_times
+from .speed_profile import (
+    PATTERN_COLUMNS,
+    estimate_arrivals,
+    get_stop_sequences,
+    learn_speed_profile,
+)
+
 
 def estimate_stop_times(
     method, trip_id, route_id, shape_id, service_id, trip_times
@@ -96,76 +106,179 @@ def estimate_method_B(
 ) -> pd.DataFrame:
     """Generate the stop times for a GTFS feed in the Databús platform.
 
+    The delay polynomials of every stop are fitted once (see
+    `fit_polynomials`) and all the trips of each pattern are evaluated at
+    once with their start time in seconds.
+
     Parameters
     ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trip_times : DataFrame
+        The start time of each trip.
+    trips : DataFrame
+        The GTFS trips.
 
-    route_id : str
-        The route_id for which to estimate stop times.
-    service_id : str
-        The service_id for which to estimate stop times.
-
+    Returns
+    -------
+    DataFrame
+        A DataFrame containing the estimated stop times of all the trips.
+        Stops without a polynomial have no arrival time.
     """
+    polynomials = fit_polynomials(stops_measurement)
+    return estimate_trip_times(trip_times, polynomials, route_stops, trips)
 
-    # Crear un DataFrame vacío para acumular los resultados
-    stop_times_df = pd.DataFrame(
-        columns=[
-            "trip_id",
-            "arrival_time",
-            "departure_time",
-            "stop_id",
-            "stop_sequence",
-            "timepoint",
-            "shape_dist_traveled",
-            "stop_headsign",
-            "pickup_type",
-            "drop_off_type",
-            "continuous_pickup",
-            "continuous_drop_off",
-        ]
+
+def estimate_method_B_frequencies(
+    stops_measurement, route_stops, trip_times, trips, frequencies
+):
+    """Generate the stop times of explicit trips and of trips defined by headways.
+
+    The trips of `trip_times` and those generated from `frequencies` (see
+    `estimate_frequencies`) are evaluated with the same polynomials, fitted
+    once, so a trip starting at the same time gets the same stop times either
+    way.
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trip_times : DataFrame
+        The start time of each explicit trip.
+    trips : DataFrame
+        The GTFS trips.
+    frequencies : DataFrame
+        The GTFS frequencies.
+
+    Returns
+    -------
+    tuple of DataFrame
+        The estimated stop times of all the trips and the rows of trips.txt
+        of the trips generated from the frequencies.
+    """
+    polynomials = fit_polynomials(stops_measurement)
+    stop_times = estimate_trip_times(trip_times, polynomials, route_stops, trips)
+    frequency_stop_times, frequency_trips = estimate_frequencies(
+        frequencies, polynomials, route_stops, trips
     )
+    stop_times = pd.concat([stop_times, frequency_stop_times], ignore_index=True)
+    return stop_times, frequency_trips
 
-    # Iterar sobre las filas del DataFrame trip_times
-    for index, row in trip_times.iterrows():
-        trip_id = row["trip_id"]
-        start_time = row["trip_time"]
 
-        # Reemplazar stops_measurement por trips
-        route_id = trips.loc[trips["trip_id"] == trip_id, "route_id"].values[0]
-        service_id = trips.loc[trips["trip_id"] == trip_id, "service_id"].values[0]
-        shape_id = trips.loc[trips["trip_id"] == trip_id, "shape_id"].values[0]
+def estimate_trip_times(trip_times, polynomials, route_stops, trips) -> pd.DataFrame:
+    """Evaluate the delay polynomials for the trips of `trip_times`.
 
-        polynomials = get_polynomials(stops_measurement)
+    Parameters
+    ----------
+    trip_times : DataFrame
+        The start time of each trip, in HH:MM:SS or HH:MM format.
+    polynomials : dict
+        The polynomials of each (route_id, service_id, shape_id, stop_id), as
+        returned by `fit_polynomials`.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    trips : DataFrame
+        The GTFS trips.
 
-        # Llamada a la función estimator
-        sequence_of_stops, estimated_arrival_times = estimate(
-            route_id, service_id, shape_id, start_time, polynomials, route_stops
+    Returns
+    -------
+    DataFrame
+        A DataFrame containing the estimated stop times of all the trips.
+    """
+    trip_times = trip_times.merge(
+        trips[["trip_id"] + PATTERN_COLUMNS], on="trip_id", how="inner"
+    )
+    trip_times["start_seconds"] = time_to_seconds(trip_times["trip_time"])
+    sequences = get_stop_sequences(route_stops)
+
+    stop_times = []
+    for pattern, pattern_trips in trip_times.groupby(PATTERN_COLUMNS, sort=False):
+        sequence = sequences.get((pattern[0], pattern[2]))
+        if sequence is None:
+            # No hay secuencia de paradas para este patrón
+            continue
+        sequence_of_stops = sequence["stop_id"].to_numpy()
+
+        start_times = pattern_trips["start_seconds"].to_numpy()
+        coefficients = get_pattern_coefficients(polynomials, pattern, sequence_of_stops)
+        arrivals = start_times[:, None] + evaluate_delays(coefficients, start_times)
+        stop_times.append(
+            build_stop_times(
+                pattern_trips["trip_id"].to_numpy(), sequence_of_stops, arrivals
+            )
         )
 
-        timepoint_values = [1 if i == 0 else 0 for i in range(len(sequence_of_stops))]
-
-        # Construcción de stop_times_iteration para esta iteración
-        stop_times_iteration = pd.DataFrame(
-            {
-                "trip_id": [trip_id] * len(sequence_of_stops),
-                "arrival_time": list(estimated_arrival_times.values()),
-                "departure_time": list(estimated_arrival_times.values()),
-                "stop_id": sequence_of_stops,
-                "stop_sequence": range(len(sequence_of_stops)),
-                "timepoint": timepoint_values,
-                "shape_dist_traveled": [0] * len(sequence_of_stops),
-                "stop_headsign": [0] * len(sequence_of_stops),
-                "pickup_type": [0] * len(sequence_of_stops),
-                "drop_off_type": [0] * len(sequence_of_stops),
-                "continuous_pickup": [0] * len(sequence_of_stops),
-                "continuous_drop_off": [0] * len(sequence_of_stops),
-            }
-        )
+    if not stop_times:
+        return pd.DataFrame(columns=STOP_TIMES_COLUMNS)
+    return pd.concat(stop_times, ignore_index=True)
 
-        # Concatenar los resultados de esta iteración al DataFrame principal
-        stop_times_df = pd.concat(
-            [stop_times_df, stop_times_iteration], ignore_index=True
+
+def estimate_method_C(
+    stops_measurement, route_stops, trip_times, trips, bin_size=3600
+) -> pd.DataFrame:
+    """Generate the stop times from the speed of each segment by time of day.
+
+    The speeds are learned from the measurements (see `learn_speed_profile`)
+    and all the trips of each pattern are estimated at once.
+
+    Parameters
+    ----------
+    stops_measurement : DataFrame
+        A DataFrame with the measured arrival times at each stop.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape, with
+        the column `shape_dist_traveled` in km.
+    trip_times : DataFrame
+        The start time of each trip.
+    trips : DataFrame
+        The GTFS trips.
+    bin_size : int
+        Width of the time of day bins in seconds.
+
+    Returns
+    -------
+    DataFrame
+        A DataFrame containing the estimated stop times of all the trips.
+    """
+    profile = learn_speed_profile(
+        stops_measurement, route_stops, trips, bin_size=bin_size
+    )
+
+    trip_times = trip_times.merge(
+        trips[["trip_id"] + PATTERN_COLUMNS], on="trip_id", how="inner"
+    )
+    trip_times["start_seconds"] = time_to_seconds(trip_times["trip_time"])
+
+    stop_times = []
+    for pattern, pattern_trips in trip_times.groupby(PATTERN_COLUMNS, sort=False):
+        p = profile.patterns.get_loc(pattern)
+        sequence_of_stops = profile.stops[p]
+        n_stops = len(sequence_of_stops)
+        if n_stops == 0:
+            # No hay secuencia de paradas para este patrón
+            continue
+
+        arrivals = estimate_arrivals(profile, pattern, pattern_trips["start_seconds"])
+        shape_dist_traveled = np.concatenate(
+            [[0], np.cumsum(profile.distances[p, : n_stops - 1])]
         )
-    return stop_times_df
+        stop_times.append(
+            build_stop_times(
+                pattern_trips["trip_id"].to_numpy(),
+                sequence_of_stops,
+                arrivals,
+                shape_dist_traveled,
+            )
+        )
+
+    if not stop_times:
+        # Ningún viaje con secuencia de paradas, igual que estimate_method_B
+        return pd.DataFrame(columns=STOP_TIMES_COLUMNS)
+    return pd.concat(stop_times, ignore_index=True)
 
 # -----------
 # LEGACY CODE
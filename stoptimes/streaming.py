@@ -0,0 +1,440 @@
+import asyncio
+
+import numpy as np
+
+from .fitting import (
+    power_sums,
+    solve_coefficients,
+    to_poly1d,
+)
+from .speed_profile import get_stop_sequences
+
+
+EVENT_COLUMNS = ["trip_id", "date", "stop_id", "arrival_time"]
+
+
+class DelayStatistics:
+    """Running least squares statistics of the delay polynomials.
+
+    Keeps, for every (route_id, service_id, shape_id, stop_id) combination,
+    the sums needed to fit its polynomial (see `power_sums`), so that new
+    measurements can be added at any time and the polynomials refreshed
+    without reprocessing the previous ones.
+
+    Parameters
+    ----------
+    degree : int
+        Degree of the polynomials.
+    """
+
+    def __init__(self, degree=4):
+        self.degree = degree
+        self.groups = {}
+        self.x_sums = np.zeros((0, 2 * degree + 1))
+        self.xy_sums = np.zeros((0, degree + 1))
+
+    @classmethod
+    def from_measurements(cls, stops_measurement, route_stops, degree=4):
+        """Create the statistics from a bulk table of measurements.
+
+        The measurements go through the same `ArrivalMatcher` as the streamed
+        events, so the delays of both are measured from the first stop of the
+        `route_stops` sequence and can be accumulated together.
+
+        Parameters
+        ----------
+        stops_measurement : DataFrame
+            A DataFrame with the measured arrival times at each stop.
+        route_stops : DataFrame
+            The sequence of stops for each combination of route and shape.
+        degree : int
+            Degree of the polynomials.
+        """
+        statistics = cls(degree)
+        trips = stops_measurement[
+            ["trip_id", "route_id", "service_id", "shape_id"]
+        ].drop_duplicates("trip_id")
+        matcher = ArrivalMatcher(
+            trips, route_stops, max_open_trips=max(len(stops_measurement), 1)
+        )
+        keys, x, y = matcher.match(
+            stops_measurement[EVENT_COLUMNS].itertuples(index=False, name=None)
+        )
+        statistics.update(keys, x, y)
+        return statistics
+
+    def update(self, keys, x, y):
+        """Add a batch of measurements.
+
+        Parameters
+        ----------
+        keys : list of tuple
+            The (route_id, service_id, shape_id, stop_id) of each measurement.
+        x : ndarray
+            Trip departure times in seconds.
+        y : ndarray
+            Delays in seconds.
+        """
+        groups = self.groups
+        codes = np.fromiter(
+            (groups.setdefault(key, len(groups)) for key in keys),
+            dtype=np.intp,
+            count=len(keys),
+        )
+
+        # Agrandar los arreglos si aparecieron combinaciones nuevas
+        n_new = len(groups) - len(self.x_sums)
+        if n_new > 0:
+            self.x_sums = np.vstack([self.x_sums, np.zeros((n_new, self.x_sums.shape[1]))])
+            self.xy_sums = np.vstack([self.xy_sums, np.zeros((n_new, self.xy_sums.shape[1]))])
+
+        x_sums, xy_sums = power_sums(x, y, codes, len(groups), self.degree)
+        self.x_sums += x_sums
+        self.xy_sums += xy_sums
+
+    def get_polynomials(self):
+        """Fit the polynomials with the measurements received so far.
+
+        Returns
+        -------
+        dict
+            A dictionary with a `np.poly1d` for each combination, as returned
+            by `get_polynomials`.
+        """
+        coefficients = solve_coefficients(self.x_sums, self.xy_sums, self.degree)
+        return {key: to_poly1d(coefficients[i]) for key, i in self.groups.items()}
+
+
+class ArrivalMatcher:
+    """Match vehicle arrival events to their trip and stop and compute delays.
+
+    The delay of an arrival is measured from the arrival of the same trip and
+    date at the first stop of its sequence, which is the timepoint used by
+    `estimate_method_B`. Arrivals received before that reference are kept
+    until it arrives. Repeated reports of the same (trip_id, date, stop_id),
+    common in AVL and GTFS-Realtime feeds, are only counted once.
+
+    Parameters
+    ----------
+    trips : DataFrame
+        The GTFS trips.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    max_open_trips : int
+        Number of (trip_id, date) kept in memory with their reference and
+        the stops already reported. The oldest ones are discarded first.
+    """
+
+    def __init__(self, trips, route_stops, max_open_trips=100000):
+        self.patterns = {
+            trip_id: (route_id, service_id, shape_id)
+            for trip_id, route_id, service_id, shape_id in trips[
+                ["trip_id", "route_id", "service_id", "shape_id"]
+            ].itertuples(index=False, name=None)
+        }
+        self.positions = {
+            key: {stop_id: i for i, stop_id in enumerate(sequence["stop_id"])}
+            for key, sequence in get_stop_sequences(route_stops).items()
+        }
+        self.max_open_trips = max_open_trips
+        self.references = {}
+        self.pending = {}
+        self.seen = {}
+        self.n_matched = 0
+        self.n_unmatched = 0
+        self.n_invalid = 0
+        self.n_duplicated = 0
+
+    def match(self, events):
+        """Compute the delays of a batch of events.
+
+        Parameters
+        ----------
+        events : iterable of tuple
+            The (trip_id, date, stop_id, arrival_time) of each event, with the
+            arrival time in HH:MM:SS or HH:MM format. Events with an
+            unparsable arrival time are skipped and counted in `n_invalid`.
+
+        Returns
+        -------
+        tuple
+            The (route_id, service_id, shape_id, stop_id) of each matched
+            event and the arrays of trip departure times and delays, in
+            seconds.
+        """
+        patterns, positions = self.patterns, self.positions
+        references, pending, seen = self.references, self.pending, self.seen
+        keys, x, y = [], [], []
+
+        for trip_id, date, stop_id, arrival_time in events:
+            pattern = patterns.get(trip_id)
+            if pattern is None:
+                self.n_unmatched += 1
+                continue
+            position = positions.get((pattern[0], pattern[2]), {}).get(stop_id)
+            if position is None:
+                self.n_unmatched += 1
+                continue
+            try:
+                parts = arrival_time.split(":")
+                arrival = int(parts[0]) * 3600 + int(parts[1]) * 60
+                if len(parts) > 2:
+                    arrival += int(parts[2])
+            except (AttributeError, ValueError, IndexError):
+                self.n_invalid += 1
+                continue
+            trip = (trip_id, date)
+
+            # Descartar los reportes repetidos de una misma parada
+            reported = seen.get(trip)
+            if reported is None:
+                reported = seen[trip] = set()
+                if len(seen) > self.max_open_trips:
+                    oldest = next(iter(seen))
+                    del seen[oldest]
+                    references.pop(oldest, None)
+                    pending.pop(oldest, None)
+            elif stop_id in reported:
+                self.n_duplicated += 1
+                continue
+            reported.add(stop_id)
+
+            key = pattern + (stop_id,)
+            self.n_matched += 1
+
+            if position == 0:
+                references[trip] = arrival
+                keys.append(key)
+                x.append(arrival)
+                y.append(0)
+                # Liberar las llegadas que esperaban la salida del viaje
+                for early_key, early_arrival in pending.pop(trip, ()):
+                    keys.append(early_key)
+                    x.append(arrival)
+                    y.append(early_arrival - arrival)
+            elif trip in references:
+                reference = references[trip]
+                keys.append(key)
+                x.append(reference)
+                y.append(arrival - reference)
+            else:
+                pending.setdefault(trip, []).append((key, arrival))
+
+        return keys, np.array(x, dtype=float), np.array(y, dtype=float)
+
+
+def read_header(path):
+    """Return the column names of the first line of a CSV file.
+
+    Its result can be passed as the `columns` of `ingest` when the events are
+    read with `replay_file`.
+    """
+    with open(path, "r") as f:
+        return [column.strip() for column in f.readline().rstrip("\r\n").split(",")]
+
+
+async def replay_file(path, chunk_size=1 << 16, header=True):
+    """Read the events of a file in chunks, as a stand-in for a live feed.
+
+    Parameters
+    ----------
+    path : str
+        Path to a CSV file with one event per line.
+    chunk_size : int
+        Approximate number of bytes read at a time.
+    header : bool
+        Whether the first line of the file is a header, which is skipped. See
+        `read_header` to get its column names.
+
+    Yields
+    ------
+    list of str
+        The lines of each chunk.
+    """
+    with open(path, "r") as f:
+        if header:
+            f.readline()
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            yield lines
+            # Ceder el control para que el consumidor avance
+            await asyncio.sleep(0)
+
+
+async def read_socket(host, port, chunk_size=1 << 16):
+    """Read the events sent as CSV lines through a TCP connection.
+
+    Yields
+    ------
+    list of str
+        The complete lines received in each chunk.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    remainder = b""
+    try:
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                break
+            lines = (remainder + data).split(b"\n")
+            remainder = lines.pop()
+            yield [line.decode() for line in lines if line]
+        if remainder:
+            yield [remainder.decode()]
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def get_event_fields(columns):
+    """Find the position of the (trip_id, date, stop_id, arrival_time) fields.
+
+    Parameters
+    ----------
+    columns : list of str
+        The name of each field of the lines, for example the header of
+        ``stop_times_measurement.csv``.
+
+    Returns
+    -------
+    list of int
+        The index of each column of `EVENT_COLUMNS` in `columns`.
+    """
+    columns = list(columns)
+    missing = [column for column in EVENT_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"The events have no columns {missing}.")
+    return [columns.index(column) for column in EVENT_COLUMNS]
+
+
+def parse_events(lines, fields):
+    """Extract the (trip_id, date, stop_id, arrival_time) of CSV lines.
+
+    Parameters
+    ----------
+    lines : list of str
+        The CSV lines, without quoting.
+    fields : list of int
+        The position of each event column, see `get_event_fields`.
+
+    Returns
+    -------
+    tuple
+        The list of events and the number of blank or incomplete lines that
+        were skipped.
+    """
+    n_fields = max(fields) + 1
+    events = []
+    for line in lines:
+        values = line.rstrip("\r\n").split(",")
+        if len(values) < n_fields:
+            continue
+        events.append(tuple(values[i] for i in fields))
+    return events, len(lines) - len(events)
+
+
+async def ingest(
+    source,
+    trips,
+    route_stops,
+    columns,
+    statistics=None,
+    batch_size=10000,
+    max_queue=16,
+    refresh_interval=3600,
+    on_refresh=None,
+    matcher=None,
+):
+    """Update the delay statistics with a stream of arrival events.
+
+    The source is read by a separate task into a bounded queue, so a slow
+    consumer makes the source wait instead of accumulating events in memory.
+    The events are processed in batches of about `batch_size`.
+
+    Parameters
+    ----------
+    source : async iterable
+        Yields lists of CSV lines, see `replay_file` and `read_socket`.
+    trips : DataFrame
+        The GTFS trips.
+    route_stops : DataFrame
+        The sequence of stops for each combination of route and shape.
+    columns : list of str
+        The name of each field of the lines, for example the header of the
+        file given by `read_header`. They are checked against `EVENT_COLUMNS`
+        before reading the source, raising a ValueError if any is missing.
+    statistics : DelayStatistics
+        The statistics to update. New ones are created if not given.
+    batch_size : int
+        Number of events processed together.
+    max_queue : int
+        Number of chunks of the source waiting to be processed.
+    refresh_interval : float
+        Seconds between calls to `on_refresh`.
+    on_refresh : callable
+        Called with the refreshed polynomials every `refresh_interval` and at
+        the end of the stream.
+    matcher : ArrivalMatcher
+        The matcher of the events, whose counters of matched, unmatched and
+        invalid events can be checked afterwards. A new one is created from
+        `trips` and `route_stops` if not given.
+
+    Returns
+    -------
+    DelayStatistics
+        The updated statistics.
+    """
+    fields = get_event_fields(columns)
+    if statistics is None:
+        statistics = DelayStatistics()
+    if matcher is None:
+        matcher = ArrivalMatcher(trips, route_stops)
+    queue = asyncio.Queue(maxsize=max_queue)
+
+    async def produce():
+        try:
+            async for lines in source:
+                await queue.put(lines)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    last_refresh = loop.time()
+    done = False
+
+    try:
+        while not done:
+            batch = await queue.get()
+            if batch is None:
+                break
+            # Juntar los bloques que ya estén disponibles hasta llenar el lote
+            while len(batch) < batch_size and not queue.empty():
+                lines = queue.get_nowait()
+                if lines is None:
+                    done = True
+                    break
+                batch = batch + lines
+
+            events, n_invalid = parse_events(batch, fields)
+            matcher.n_invalid += n_invalid
+            keys, x, y = matcher.match(events)
+            if keys:
+                statistics.update(keys, x, y)
+
+            if on_refresh is not None and loop.time() - last_refresh >= refresh_interval:
+                on_refresh(statistics.get_polynomials())
+                last_refresh = loop.time()
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+
+    if on_refresh is not None:
+        on_refresh(statistics.get_polynomials())
+
+    return statistics
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stoptimes.backtest import assign_folds, backtest_polynomials
+
+from test_fitting import make_measurements
+
+
+def test_kfold_keeps_each_date_in_one_fold():
+    dates = np.repeat([f"2024-01-{d:02d}" for d in range(1, 11)], 3)
+
+    folds, test_folds = assign_folds(dates, method="kfold", n_folds=4)
+
+    assert test_folds == [0, 1, 2, 3]
+    for fold in test_folds:
+        test_dates = set(dates[folds == fold])
+        fit_dates = set(dates[folds != fold])
+        assert test_dates and fit_dates
+        assert not test_dates & fit_dates
+
+
+def test_holdout_keeps_the_last_dates():
+    dates = np.repeat([f"2024-01-{d:02d}" for d in range(1, 11)], 3)
+
+    folds, test_folds = assign_folds(dates, method="holdout", test_size=0.2)
+
+    assert test_folds == [1]
+    assert set(dates[folds == 1]) == {"2024-01-09", "2024-01-10"}
+    assert not set(dates[folds == 1]) & set(dates[folds == 0])
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        assign_folds(["2024-01-01", "2024-01-02"], method="random")
+
+
+def test_serial_and_pool_runs_agree():
+    measurement = make_measurements(n_dates=6)
+
+    serial = backtest_polynomials(
+        measurement, degrees=(1, 3), n_folds=3, max_workers=1
+    )
+    pooled = backtest_polynomials(
+        measurement, degrees=(1, 3), n_folds=3, max_workers=2
+    )
+
+    stop_errors, route_errors = serial
+    for serial_table, pooled_table in zip(serial, pooled):
+        pd.testing.assert_frame_equal(serial_table, pooled_table)
+    assert list(stop_errors.columns) == [
+        "route_id",
+        "service_id",
+        "shape_id",
+        "stop_id",
+        "degree",
+        "mae",
+        "p90",
+        "n",
+    ]
+    assert list(route_errors.columns) == ["route_id", "degree", "mae", "p90", "n"]
+
+    # La parada de referencia no se evalúa, las demás una vez por grado
+    assert "stop_0" not in set(stop_errors["stop_id"])
+    n_evaluated = (measurement["timepoint"] != 1).sum()
+    assert route_errors.groupby("degree")["n"].sum().eq(n_evaluated).all()
+    assert (stop_errors["p90"] >= 0).all() and (stop_errors["mae"] > 0).all()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from stoptimes.fitting import fit_polynomials, get_delays, time_to_seconds
+
+
+def make_measurements(n_dates=6, n_stops=4, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for start in range(6 * 3600, 18 * 3600, 3600):
+        for d in range(n_dates):
+            arrival = start + int(rng.integers(-60, 60))
+            for i in range(n_stops):
+                if i:
+                    arrival += int(100 + 40 * np.sin(start / 7200) + rng.normal(0, 10))
+                rows.append(
+                    (
+                        f"trip_{start}",
+                        f"2024-01-{d + 1:02d}",
+                        "R1",
+                        "entresemana",
+                        "shape_1",
+                        f"stop_{i}",
+                        f"{arrival // 3600:02d}:{arrival // 60 % 60:02d}:{arrival % 60:02d}",
+                        int(i == 0),
+                    )
+                )
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "trip_id",
+            "date",
+            "route_id",
+            "service_id",
+            "shape_id",
+            "stop_id",
+            "arrival_time",
+            "timepoint",
+        ],
+    )
+
+
+def test_time_to_seconds_missing_and_short_times():
+    seconds = time_to_seconds(["06:00:00", np.nan, None, "06:10", "25:00:30"])
+
+    assert seconds[0] == 21600
+    assert np.isnan(seconds[1]) and np.isnan(seconds[2])
+    assert seconds[3] == 22200
+    assert seconds[4] == 90030
+
+
+def test_get_delays_drops_missing_arrivals():
+    measurement = make_measurements()
+    measurement.loc[measurement.index[5], "arrival_time"] = np.nan
+
+    delays = get_delays(measurement)
+
+    assert len(delays) == len(measurement) - 1
+    assert delays["delay"].min() >= 0
+
+
+def test_fit_polynomials_matches_polyfit():
+    measurement = make_measurements()
+    polynomials = fit_polynomials(measurement, degree=3)
+    delays = get_delays(measurement)
+    x = np.linspace(6 * 3600, 18 * 3600, 7)
+
+    for i in range(4):
+        subset = delays[delays["stop_id"] == f"stop_{i}"]
+        expected = np.poly1d(
+            np.polyfit(subset["departure_seconds"], subset["delay"], 3)
+        )
+        polynomial = polynomials[("R1", "entresemana", "shape_1", f"stop_{i}")]
+        np.testing.assert_allclose(polynomial(x), expected(x), rtol=1e-7, atol=1e-6)
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from stoptimes.fitting import fit_polynomials, time_to_seconds
+from stoptimes.frequencies import estimate_frequencies, iter_frequency_starts
+
+from test_fitting import make_measurements
+
+
+def make_feed():
+    route_stops = pd.DataFrame(
+        {
+            "route_id": "R1",
+            "shape_id": "shape_1",
+            "stop_id": [f"stop_{i}" for i in range(4)],
+            "stop_sequence": range(1, 5),
+        }
+    )
+    trips = pd.DataFrame(
+        {
+            "route_id": ["R1", "R2"],
+            "service_id": "entresemana",
+            "trip_id": ["base", "sin_paradas"],
+            "shape_id": ["shape_1", "shape_2"],
+            "direction_id": 0,
+        }
+    )
+    frequencies = pd.DataFrame(
+        {
+            "trip_id": ["base", "sin_paradas"],
+            "start_time": ["06:00:00", "06:00:00"],
+            "end_time": ["08:30:00", "07:00:00"],
+            "headway_secs": [1800, 600],
+            "exact_times": 0,
+        }
+    )
+    return route_stops, trips, frequencies
+
+
+def test_start_times_exclude_end_time():
+    _, _, frequencies = make_feed()
+
+    trip_id, start, end, start_times = next(iter_frequency_starts(frequencies))
+
+    assert trip_id == "base"
+    assert (start, end) == (21600, 30600)
+    np.testing.assert_array_equal(start_times, 21600 + 1800 * np.arange(5))
+
+
+def test_exact_matches_polynomials_per_trip():
+    route_stops, trips, frequencies = make_feed()
+    polynomials = fit_polynomials(make_measurements())
+
+    stop_times, new_trips = estimate_frequencies(
+        frequencies, polynomials, route_stops, trips
+    )
+
+    # El patrón sin secuencia de paradas no genera viajes
+    expected_ids = [
+        f"base_{time}"
+        for time in ["06:00:00", "06:30:00", "07:00:00", "07:30:00", "08:00:00"]
+    ]
+    assert new_trips["trip_id"].tolist() == expected_ids
+    assert list(new_trips.columns) == list(trips.columns)
+    assert (new_trips["shape_id"] == "shape_1").all()
+    assert set(stop_times["trip_id"]) == set(expected_ids)
+
+    for trip_id, trip_stop_times in stop_times.groupby("trip_id"):
+        start = time_to_seconds([trip_id.rsplit("_", 1)[1]])[0]
+        expected = [
+            start
+            + polynomials[("R1", "entresemana", "shape_1", stop_id)](start)
+            for stop_id in trip_stop_times["stop_id"]
+        ]
+        np.testing.assert_allclose(
+            time_to_seconds(trip_stop_times["arrival_time"]), expected, atol=0.5
+        )
+    assert stop_times.groupby("trip_id")["timepoint"].first().eq(1).all()
+
+
+def test_templates_follow_the_time_of_day():
+    route_stops, trips, frequencies = make_feed()
+    polynomials = fit_polynomials(make_measurements())
+
+    stop_times, template_trips, template_frequencies = estimate_frequencies(
+        frequencies, polynomials, route_stops, trips, representation="template"
+    )
+
+    # Subventanas de una hora alineadas con el intervalo entre viajes
+    assert template_frequencies["start_time"].tolist() == [
+        "06:00:00",
+        "07:00:00",
+        "08:00:00",
+    ]
+    assert template_frequencies["end_time"].tolist() == [
+        "07:00:00",
+        "08:00:00",
+        "08:30:00",
+    ]
+    assert (template_frequencies["headway_secs"] == 1800).all()
+    assert (
+        template_frequencies["trip_id"].tolist() == template_trips["trip_id"].tolist()
+    )
+    assert set(stop_times["trip_id"]) == set(template_trips["trip_id"])
+
+    # Cada plantilla comienza con su subventana y usa los retrasos de su centro
+    last_stop = stop_times.groupby("trip_id", sort=False).last()
+    for trip_id, start, middle in [
+        ("base_06:00:00", 21600, 23400),
+        ("base_07:00:00", 25200, 27000),
+        ("base_08:00:00", 28800, 29700),
+    ]:
+        polynomial = polynomials[("R1", "entresemana", "shape_1", "stop_3")]
+        assert time_to_seconds([last_stop.loc[trip_id, "arrival_time"]])[0] == round(
+            start + polynomial(middle)
+        )
+
+    _, _, whole_window = estimate_frequencies(
+        frequencies,
+        polynomials,
+        route_stops,
+        trips,
+        representation="template",
+        max_window=None,
+    )
+    assert whole_window[["start_time", "end_time"]].values.tolist() == [
+        ["06:00:00", "08:30:00"]
+    ]
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from stoptimes.speed_profile import get_stop_distances
+
+
+def test_stops_without_coordinates_have_no_distance():
+    shapes = pd.DataFrame(
+        {
+            "shape_id": "shape_1",
+            "shape_pt_sequence": range(3),
+            "shape_pt_lat": 0.0,
+            "shape_pt_lon": [0.0, 0.01, 0.02],
+            "shape_dist_traveled": [0.0, 1.1, 2.2],
+        }
+    )
+    stops = pd.DataFrame(
+        {
+            "stop_id": ["stop_0", "stop_1", "stop_2"],
+            "stop_lat": [0.0, np.nan, 0.0],
+            "stop_lon": [0.0, 0.01, 0.02],
+        }
+    )
+    route_stops = pd.DataFrame(
+        {
+            "route_id": "R1",
+            "shape_id": "shape_1",
+            "stop_id": ["stop_0", "stop_1", "stop_2", "stop_3"],
+        }
+    )
+
+    distances = get_stop_distances(shapes, stops, route_stops)
+
+    # Ni la parada sin latitud ni la ausente de stops caen al inicio del shape
+    np.testing.assert_array_equal(
+        distances["shape_dist_traveled"], [0.0, np.nan, 2.2, np.nan]
+    )
+    assert list(distances.columns) == list(route_stops.columns) + [
+        "shape_dist_traveled"
+    ]
@@ -0,0 +1,153 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stoptimes.streaming import (
+    ArrivalMatcher,
+    DelayStatistics,
+    ingest,
+    read_header,
+    replay_file,
+)
+
+from test_fitting import make_measurements
+
+
+def make_network(n_stops=4):
+    route_stops = pd.DataFrame(
+        {
+            "route_id": "R1",
+            "shape_id": "shape_1",
+            "stop_id": [f"stop_{i}" for i in range(n_stops)],
+            "stop_sequence": range(1, n_stops + 1),
+        }
+    )
+    trips = pd.DataFrame(
+        {
+            "route_id": "R1",
+            "service_id": "entresemana",
+            "trip_id": ["trip_21600", "trip_25200"],
+            "shape_id": "shape_1",
+        }
+    )
+    return route_stops, trips
+
+
+def test_arrivals_before_the_first_stop_wait_for_it():
+    route_stops, trips = make_network()
+    matcher = ArrivalMatcher(trips, route_stops)
+
+    keys, x, y = matcher.match(
+        [
+            ("trip_21600", "2024-01-01", "stop_2", "06:05:00"),
+            ("trip_21600", "2024-01-01", "stop_1", "06:02:30"),
+        ]
+    )
+    assert keys == [] and matcher.pending
+
+    keys, x, y = matcher.match([("trip_21600", "2024-01-01", "stop_0", "06:01")])
+
+    assert [key[-1] for key in keys] == ["stop_0", "stop_2", "stop_1"]
+    np.testing.assert_array_equal(x, [21660, 21660, 21660])
+    np.testing.assert_array_equal(y, [0, 240, 90])
+    assert not matcher.pending
+    assert matcher.n_matched == 3
+
+
+def test_duplicated_invalid_and_unmatched_events_are_counted():
+    route_stops, trips = make_network()
+    matcher = ArrivalMatcher(trips, route_stops)
+
+    keys, x, y = matcher.match(
+        [
+            ("trip_21600", "2024-01-01", "stop_0", "06:00:00"),
+            ("trip_21600", "2024-01-01", "stop_1", "06:02:00"),
+            ("trip_21600", "2024-01-01", "stop_1", "06:02:10"),
+            ("trip_21600", "2024-01-02", "stop_1", "06:03:00"),
+            ("trip_21600", "2024-01-01", "stop_2", "6h04"),
+            ("trip_21600", "2024-01-01", "stop_3", None),
+            ("trip_99999", "2024-01-01", "stop_1", "06:02:00"),
+            ("trip_21600", "2024-01-01", "stop_9", "06:02:00"),
+        ]
+    )
+
+    np.testing.assert_array_equal(y, [0, 120])
+    assert matcher.n_matched == 3
+    assert matcher.n_duplicated == 1
+    assert matcher.n_invalid == 2
+    assert matcher.n_unmatched == 2
+
+
+def test_oldest_trips_are_evicted():
+    route_stops, trips = make_network()
+    matcher = ArrivalMatcher(trips, route_stops, max_open_trips=1)
+
+    matcher.match(
+        [
+            ("trip_21600", "2024-01-01", "stop_1", "06:02:00"),
+            ("trip_25200", "2024-01-01", "stop_0", "07:00:00"),
+        ]
+    )
+    keys, x, y = matcher.match(
+        [
+            ("trip_21600", "2024-01-01", "stop_0", "06:00:00"),
+            ("trip_25200", "2024-01-01", "stop_1", "07:02:00"),
+        ]
+    )
+
+    # La llegada pendiente del primer viaje se descartó junto con él, y la
+    # referencia del segundo al volver a abrir el primero
+    assert [key[-1] for key in keys] == ["stop_0"]
+    assert list(matcher.seen) == [("trip_25200", "2024-01-01")]
+    assert matcher.references == {}
+    assert ("trip_25200", "2024-01-01") in matcher.pending
+
+
+def test_ingest_matches_bulk_statistics(tmp_path):
+    measurement = make_measurements()
+    route_stops, _ = make_network()
+    trips = measurement[
+        ["trip_id", "route_id", "service_id", "shape_id"]
+    ].drop_duplicates()
+    path = tmp_path / "stop_times_measurement.csv"
+    measurement.to_csv(path, index=False)
+    with open(path, "a") as f:
+        f.write("\ntrip_21600,2024-01-01\n")
+
+    matcher = ArrivalMatcher(trips, route_stops)
+    refreshed = []
+    statistics = asyncio.run(
+        ingest(
+            replay_file(path, chunk_size=512),
+            trips,
+            route_stops,
+            read_header(path),
+            batch_size=50,
+            max_queue=2,
+            on_refresh=refreshed.append,
+            matcher=matcher,
+        )
+    )
+    expected = DelayStatistics.from_measurements(measurement, route_stops)
+
+    assert matcher.n_matched == len(measurement)
+    assert matcher.n_invalid == 2
+    assert statistics.groups == expected.groups
+    np.testing.assert_allclose(statistics.x_sums, expected.x_sums)
+    np.testing.assert_allclose(statistics.xy_sums, expected.xy_sums)
+    assert refreshed and refreshed[-1].keys() == expected.get_polynomials().keys()
+
+
+def test_ingest_checks_the_columns_before_reading():
+    route_stops, trips = make_network()
+
+    async def source():
+        raise AssertionError("the source should not be read")
+        yield
+
+    with pytest.raises(ValueError):
+        asyncio.run(
+            ingest(source(), trips, route_stops, ["trip_id", "date", "stop_id"])
+        )